@@ -2,19 +2,31 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
+import openpyxl
+import pyarrow as pa
+import pyarrow.csv as pac
+import csv
 from datetime import datetime, timedelta
+from io import BytesIO, StringIO
 
 st.set_page_config(layout="wide", page_title="Groseri Manager Dashboard (Streamlit)")
 
 # -----------------------
 # Helper functions
 # -----------------------
-def rag_emoji(value, thresholds):
-    """Return emoji menurut thresholds dict {'green':x,'yellow':y} where x>=green threshold, y>=yellow threshold."""
+def rag_emoji(value, thresholds, reverse=False):
+    """Return emoji menurut thresholds dict {'green':x,'yellow':y} where x>=green threshold, y>=yellow threshold.
+    reverse=True untuk KPI yang semakin kecil semakin bagus (value<=green, value<=yellow)."""
     try:
         if pd.isna(value):
             return "⚪"
+        if reverse:
+            if value <= thresholds["green"]:
+                return "🟢"
+            elif value <= thresholds["yellow"]:
+                return "🟡"
+            else:
+                return "🔴"
         if value >= thresholds["green"]:
             return "🟢"
         elif value >= thresholds["yellow"]:
@@ -24,6 +36,30 @@ def rag_emoji(value, thresholds):
     except Exception:
         return "⚪"
 
+def format_pct(series):
+    """Format kolom rasio jadi string persen ('12.34%'); NaN jadi '-'."""
+    v = series.to_numpy(dtype=float)
+    mask = ~np.isnan(v)
+    out = np.full(v.shape, "-", dtype=object)
+    out[mask] = [f"{x:.2%}" for x in v[mask]]
+    return out
+
+def to_arrow_dtypes(df):
+    """Pakai dtype PyArrow untuk kolom string/numerik; kolom tanggal tetap datetime64 (aksesor .dt lengkap).
+    Kolom campuran (mis. Batch_No berisi teks dan angka) dijadikan string[pyarrow];
+    kolom kosong/semua null dibiarkan object agar to_num / pd.to_datetime yang menentukan tipenya."""
+    # per posisi kolom, agar tidak bergantung pada nama kolom yang unik
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if pd.api.types.is_datetime64_any_dtype(col):
+            continue
+        col = col.convert_dtypes(dtype_backend='pyarrow')
+        if col.dtype == object and col.notna().any():
+            col = col.astype('string[pyarrow]')
+        df.isetitem(i, col)
+    return df
+
+@st.cache_data(show_spinner=False)
 def load_sample_data():
     # Sample Sales Data: Tanggal, Produk, Qty, Harga, Total, Stok_Awal, Sisa_Stok
     sales = pd.DataFrame([
@@ -53,13 +89,66 @@ def load_sample_data():
         ["Susu UHT 1L",100000000,115000000,10000000],
     ], columns=["Promosi","Target_Sales","Actual_Sales","Biaya_Promosi"])
 
-    return sales, expiry, pricing, promo
-
-def safe_convert_num(x):
+    return to_arrow_dtypes(sales), to_arrow_dtypes(expiry), to_arrow_dtypes(pricing), to_arrow_dtypes(promo)
+
+def to_num(df, cols):
+    """Konversi kolom ke numerik (in place); nilai yang gagal dikonversi jadi NaN."""
+    for c in cols:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+
+# Sheet yang dibaca dari workbook (lowercase), urutan sama dengan return load_sample_data / load_workbook
+SHEETS = ("sales data", "expiry data", "pricing data", "promo data")
+
+def clean_header(header):
+    """Nama kolom seperti read_excel: sel header kosong -> 'Unnamed: i', nama ganda -> 'x.1', 'x.2', ..."""
+    counts = {}
+    names = []
+    for i, name in enumerate(header):
+        if name is None:
+            name = f"Unnamed: {i}"
+        base = name
+        n = counts.get(name, 0)
+        while n > 0:
+            counts[name] = n + 1
+            name = f"{base}.{n}"
+            n = counts.get(name, 0)
+        counts[name] = n + 1
+        names.append(name)
+    return names
+
+def sheet_to_df(ws):
+    """Ubah worksheet openpyxl (read-only) jadi DataFrame; baris pertama = header."""
+    # tag <dimension> bisa salah (ditulis aplikasi lain); seperti pandas, baca ukuran sheet dari data
+    ws.reset_dimensions()
+    # baca baris langsung dari XML sheet; baris yang seluruhnya kosong dilewati
+    rows = [r for r in ws.iter_rows(values_only=True) if any(v is not None for v in r)]
+    if not rows:
+        return pd.DataFrame()
+    # tanpa dimension, panjang baris bisa tidak sama: buang sel kosong di ujung, lalu pad ke lebar terpanjang
+    rows = [r[:max(i for i, v in enumerate(r) if v is not None) + 1] for r in rows]
+    width = max(len(r) for r in rows)
+    rows = [r + (None,) * (width - len(r)) for r in rows]
+    return to_arrow_dtypes(pd.DataFrame(rows[1:], columns=clean_header(rows[0])))
+
+@st.cache_data(show_spinner=False)
+def load_workbook(file_bytes):
+    """Baca ke-4 sheet dari bytes file Excel. Di-cache per isi file agar rerun tidak parse ulang."""
+    # Satu workbook read_only + data_only untuk semua sheet: shared strings dibaca sekali,
+    # nilai sel di-stream tanpa membangun model sel/style openpyxl penuh
+    wb = openpyxl.load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
     try:
-        return float(x)
-    except:
-        return np.nan
+        # Try read known sheet names variations (case-insensitive), resolved once
+        sheet_names = {s.lower(): s for s in wb.sheetnames}
+        present = {k: sheet_names[k] for k in SHEETS if k in sheet_names}
+        frames = {k: sheet_to_df(wb[name]) for k, name in present.items()}
+    finally:
+        # workbook read-only menahan handle arsip sampai ditutup
+        wb.close()
+    if len(frames) < len(SHEETS):
+        # Default placeholders if not present
+        frames = {**dict(zip(SHEETS, load_sample_data())), **frames}
+    return tuple(frames[k] for k in SHEETS)
 
 # -----------------------
 # UI: Upload file / use sample
@@ -71,20 +160,7 @@ uploaded_file = st.file_uploader("Upload file Excel (.xlsx) (opsional)", type=["
 
 if uploaded_file is not None:
     try:
-        xls = pd.ExcelFile(uploaded_file)
-        # Try read known sheet names variations
-        sheet_names = {s.lower(): s for s in xls.sheet_names}
-        def get_sheet(name_lower, default_df):
-            if name_lower in sheet_names:
-                return pd.read_excel(xls, sheet_names[name_lower])
-            else:
-                return default_df
-        # Default placeholders if not present
-        default_sales, default_expiry, default_pricing, default_promo = load_sample_data()
-        sales = get_sheet("sales data", default_sales)
-        expiry = get_sheet("expiry data", default_expiry)
-        pricing = get_sheet("pricing data", default_pricing)
-        promo = get_sheet("promo data", default_promo)
+        sales, expiry, pricing, promo = load_workbook(uploaded_file.getvalue())
     except Exception as e:
         st.error(f"Gagal membaca file Excel: {e}")
         sales, expiry, pricing, promo = load_sample_data()
@@ -96,87 +172,115 @@ else:
 # Normalize sales table columns (best effort)
 # -----------------------
 # Ensure datetime, numeric columns
+# (parse hanya jika belum datetime; sample data & sel tanggal Excel sudah datetime64)
 if 'Tanggal' in sales.columns:
-    sales['Tanggal'] = pd.to_datetime(sales['Tanggal'], errors='coerce')
+    if not pd.api.types.is_datetime64_any_dtype(sales['Tanggal']):
+        sales['Tanggal'] = pd.to_datetime(sales['Tanggal'], errors='coerce')
 else:
     st.error("Sheet Sales Data harus punya kolom 'Tanggal'.")
 if 'Produk' not in sales.columns:
     st.error("Sheet Sales Data harus punya kolom 'Produk'.")
+if not pd.api.types.is_datetime64_any_dtype(expiry['Exp_Date']):
+    expiry['Exp_Date'] = pd.to_datetime(expiry['Exp_Date'], errors='coerce')
 
-# numeric conversions
-for col in ['Qty','Harga','Total','Stok_Awal','Sisa_Stok']:
-    if col in sales.columns:
-        sales[col] = sales[col].apply(safe_convert_num)
-
-# ensure Total column (compute if missing)
-if 'Total' not in sales.columns or sales['Total'].isnull().all():
-    sales['Total'] = sales['Qty'] * sales['Harga']
-
-# If Stok_Awal or Sisa_Stok missing, leave NaN
-# Add Year column to help baseline mapping
-sales['Year'] = sales['Tanggal'].dt.year
+# Produk berulang dengan kardinalitas rendah: category agar groupby pakai kode int, bukan hash string
+for df in (sales, expiry, pricing, promo):
+    if 'Produk' in df.columns:
+        df['Produk'] = df['Produk'].astype('category')
 
 # -----------------------
 # Compute Baseline Juni per product per year
 # -----------------------
-# sum totals where month==6 grouped by (Produk, Year)
-june_totals = (sales[sales['Tanggal'].dt.month == 6]
-               .groupby(['Produk','Year'], as_index=False)
-               .agg({'Total':'sum'})
-               .rename(columns={'Total':'JuneTotal'}))
-
-# Merge back to sales
-sales = sales.merge(june_totals, on=['Produk','Year'], how='left')
-
-# Trend vs Juni per row: safe
-def compute_trend(row):
-    jt = row.get('JuneTotal', np.nan)
-    total = row.get('Total', np.nan)
-    try:
-        if pd.isna(jt) or jt == 0:
-            return np.nan
-        else:
-            return (total / jt) - 1
-    except Exception:
-        return np.nan
-
-sales['Trend_vs_Juni'] = sales.apply(compute_trend, axis=1)
+@st.cache_data(show_spinner=False)
+def compute_sales_features(sales):
+    """Tambah kolom turunan sales (Year, Month, JuneTotal, Trend_vs_Juni, MonthYear). Di-cache per isi DataFrame."""
+    # numeric conversions
+    to_num(sales, ['Qty','Harga','Total','Stok_Awal','Sisa_Stok'])
+
+    # ensure Total column (compute if missing)
+    if 'Total' not in sales.columns or sales['Total'].isnull().all():
+        sales['Total'] = sales['Qty'] * sales['Harga']
+
+    # If Stok_Awal or Sisa_Stok missing, leave NaN
+    # Year / Month / MonthYear (YYYYMM) dihitung sekali sebagai int (nullable untuk tanggal kosong)
+    dt = sales['Tanggal'].dt
+    year, month = dt.year, dt.month
+    sales['Year'] = year.astype('Int16')
+    sales['Month'] = month.astype('Int8')
+
+    # sum totals where month==6 grouped by (Produk, Year), broadcast back per row (0 jika tidak ada data Juni)
+    # group id integer per (Produk, Year); -1 untuk baris dengan key kosong
+    gid = sales.groupby(['Produk','Year'], sort=False, observed=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    is_june = (sales['Month'] == 6).to_numpy(dtype=bool, na_value=False)
+    total_arr = sales['Total'].to_numpy(dtype=float)
+    valid = gid >= 0
+    june_w = np.where(is_june & ~np.isnan(total_arr), total_arr, 0.0)
+    june_sum = np.bincount(gid[valid], weights=june_w[valid], minlength=gid.max(initial=-1) + 1)
+    june_total = np.full(len(sales), np.nan)
+    june_total[valid] = june_sum[gid[valid]]
+    sales['JuneTotal'] = june_total
+
+    # Trend vs Juni per row: safe (NaN jika baseline Juni nol / tidak ada)
+    mask = ~np.isnan(june_total) & (june_total != 0)
+    trend = np.full_like(total_arr, np.nan)
+    np.divide(total_arr, june_total, out=trend, where=mask)
+    trend[mask] -= 1
+    sales['Trend_vs_Juni'] = trend
+    # MonthYear ditambahkan terakhir agar urutan kolom export sama seperti sebelumnya
+    sales['MonthYear'] = (year * 100 + month).astype('Int32')
+    return sales
+
+sales = compute_sales_features(sales)
 
 # -----------------------
 # KPI calculations
 # -----------------------
-# Promo KPI
-promo['Target_Sales'] = promo['Target_Sales'].apply(safe_convert_num)
-promo['Actual_Sales'] = promo['Actual_Sales'].apply(safe_convert_num)
-promo['Biaya_Promosi'] = promo['Biaya_Promosi'].apply(safe_convert_num)
-
-total_actual = promo['Actual_Sales'].sum() if 'Actual_Sales' in promo.columns else 0.0
-total_target = promo['Target_Sales'].sum() if 'Target_Sales' in promo.columns else 0.0
-pencapaian = (total_actual / total_target) if total_target and total_target!=0 else np.nan
-
-# Pricing margin (per product)
-if 'Harga_Beli' in pricing.columns and 'Harga_Jual' in pricing.columns:
-    pricing['Margin_pct'] = (pricing['Harga_Jual'] - pricing['Harga_Beli']) / pricing['Harga_Jual']
-else:
-    pricing['Margin_pct'] = np.nan
+@st.cache_data(show_spinner=False)
+def compute_kpis(promo, pricing):
+    """Hitung margin pricing, ROI promo, dan ringkasan KPI. Di-cache per isi DataFrame."""
+    # Pricing margin (per product)
+    if 'Harga_Beli' in pricing.columns and 'Harga_Jual' in pricing.columns:
+        pricing['Margin_pct'] = (pricing['Harga_Jual'] - pricing['Harga_Beli']) / pricing['Harga_Jual']
+    else:
+        pricing['Margin_pct'] = np.nan
+    # average margin over products
+    avg_margin = pricing['Margin_pct'].mean() if not pricing['Margin_pct'].isna().all() else np.nan
 
-# ROI per promo row and combined
-if 'Biaya_Promosi' in promo.columns and 'Actual_Sales' in promo.columns and 'Target_Sales' in promo.columns:
-    promo['ROI'] = promo.apply(lambda r: (r['Actual_Sales'] - r['Target_Sales'])/r['Biaya_Promosi'] if (r['Biaya_Promosi'] and r['Biaya_Promosi']!=0) else np.nan, axis=1)
-else:
-    promo['ROI'] = np.nan
-combined_roi = promo['ROI'].mean() if 'ROI' in promo.columns else np.nan
+    # Promo KPI: ROI per promo row, lalu total & rata-rata ROI dalam satu agg
+    if {'Target_Sales','Actual_Sales','Biaya_Promosi'}.issubset(promo.columns):
+        to_num(promo, ['Target_Sales','Actual_Sales','Biaya_Promosi'])
+        biaya = promo['Biaya_Promosi'].to_numpy(dtype=float)
+        selisih = (promo['Actual_Sales'] - promo['Target_Sales']).to_numpy(dtype=float)
+        roi = np.full_like(selisih, np.nan)
+        np.divide(selisih, biaya, out=roi, where=biaya != 0)
+        promo['ROI'] = roi
+        agg = promo.agg({'Actual_Sales':'sum', 'Target_Sales':'sum', 'ROI':'mean'})
+        total_actual, total_target, combined_roi = agg['Actual_Sales'], agg['Target_Sales'], agg['ROI']
+    else:
+        promo['ROI'] = np.nan
+        total_actual, total_target, combined_roi = 0.0, 0.0, np.nan
+    pencapaian = (total_actual / total_target) if total_target and total_target!=0 else np.nan
+    return promo, pricing, total_actual, pencapaian, avg_margin, combined_roi
+
+promo, pricing, total_actual, pencapaian, avg_margin, combined_roi = compute_kpis(promo, pricing)
+
+# Stok availability & expiry risk (expiry bergantung tanggal hari ini, jadi tidak di-cache)
+stok_awal_sum = sales['Stok_Awal'].sum() if 'Stok_Awal' in sales.columns else 0
+stok_avail = (sales['Sisa_Stok'].sum() / stok_awal_sum) if stok_awal_sum and 'Sisa_Stok' in sales.columns else np.nan
+expiry_risk = expiry.loc[expiry['Exp_Date'] <= pd.Timestamp.today() + pd.Timedelta(days=30), 'Qty_Stok'].sum()
 
 # -----------------------
 # Dashboard display
 # -----------------------
 st.header("KPI Ringkasan")
-col1, col2, col3 = st.columns(3)
+col1, col2, col3, col4, col5 = st.columns(5)
 
 # thresholds (you can expose UI later to edit)
 sales_thresholds = {"green":1.0, "yellow":0.8}      # pencapaian: >=100% green, >=80% amber
 margin_thresholds = {"green":0.20, "yellow":0.15}  # margin: >=20% green, >=15% amber
 roi_thresholds = {"green":1.0, "yellow":0.5}       # ROI: >=100% green, >=50% amber
+stock_thresholds = {"green":0.7, "yellow":0.4}     # stok availability: >=70% green, >=40% amber
+expiry_thresholds = {"green":100, "yellow":500}    # expiry risk (unit): <=100 green, <=500 amber
 
 with col1:
     st.subheader("Sales")
@@ -185,8 +289,6 @@ with col1:
 
 with col2:
     st.subheader("Margin (sample)")
-    # show average margin or first product margin
-    avg_margin = pricing['Margin_pct'].mean() if not pricing['Margin_pct'].isna().all() else np.nan
     st.metric("Avg Margin", f"{avg_margin:.2%}" if not pd.isna(avg_margin) else "N/A")
     st.markdown(f"**Status**: {rag_emoji(avg_margin, margin_thresholds)}", unsafe_allow_html=True)
 
@@ -195,82 +297,75 @@ with col3:
     st.metric("Avg ROI", f"{combined_roi:.2%}" if not pd.isna(combined_roi) else "N/A")
     st.markdown(f"**Status**: {rag_emoji(combined_roi, roi_thresholds)}", unsafe_allow_html=True)
 
+with col4:
+    st.subheader("Stok")
+    st.metric("Stok Availability", f"{stok_avail:.1%}" if not pd.isna(stok_avail) else "N/A",
+              help="Sisa_Stok / Stok_Awal. Hijau jika ketersediaan stok aman.")
+    st.markdown(f"**Status**: {rag_emoji(stok_avail, stock_thresholds)}", unsafe_allow_html=True)
+
+with col5:
+    st.subheader("Expiry Risk")
+    st.metric("Stok exp. ≤ 30 hari", f"{int(expiry_risk):,} unit",
+              help="Qty stok yang expired / expired dalam 30 hari. Merah = risiko tinggi.")
+    st.markdown(f"**Status**: {rag_emoji(expiry_risk, expiry_thresholds, reverse=True)}", unsafe_allow_html=True)
+
 # -----------------------
 # Visual: Trend by product (monthly sum)
 # -----------------------
 st.header("Grafik Tren Penjualan (per bulan — sum Total)")
 
-# create month-year column
-sales['MonthYear'] = sales['Tanggal'].dt.to_period('M').astype(str)
-monthly = sales.groupby(['MonthYear','Produk'], as_index=False).agg({'Total':'sum'})
-fig = px.line(monthly, x='MonthYear', y='Total', color='Produk', markers=True, title="Tren Penjualan per Produk (bulanan)")
-st.plotly_chart(fig, use_container_width=True)
+@st.cache_data(show_spinner=False)
+def compute_monthly(sales):
+    """Sum Total per (MonthYear, Produk)."""
+    return (sales['Total']
+            .groupby([sales['MonthYear'], sales['Produk']], observed=True)
+            .sum()
+            .reset_index())
+
+monthly = compute_monthly(sales)
+# wide format (MonthYear x Produk) dikirim langsung sebagai tabel Arrow ke st.line_chart
+wide = monthly.pivot(index='MonthYear', columns='Produk', values='Total').sort_index()
+wide.index = [f"{m // 100}-{m % 100:02d}" for m in wide.index]
+st.line_chart(wide, y_label="Total")
 
 # -----------------------
 # Table: Sales Data with Trend coloring
 # -----------------------
 st.header("Sales Data (detail)")
-# Prepare display table
-display_sales = sales.copy()
-# Friendly formatting
-display_sales['Total'] = display_sales['Total'].fillna(0).astype(float)
-display_sales['Trend_vs_Juni_pct'] = display_sales['Trend_vs_Juni'].map(lambda x: f"{x:.2%}" if not pd.isna(x) else "-")
-
-# Conditional color function for styler
-def color_trend(val):
-    try:
-        if pd.isna(val):
-            return ''
-        v = float(val)
-        if v > 0:
-            return 'background-color: #C6EFCE'  # light green
-        elif v < 0:
-            return 'background-color: #F4CCCC'  # light red
-        else:
-            return 'background-color: #FFF2CC'  # light yellow
-    except:
-        return ''
-
-# color low stock
-def color_stock(val):
-    try:
-        v = float(val)
-        if v <= 50:
-            return 'background-color: #F4CCCC'  # red
-        else:
-            return ''
-    except:
-        return ''
-
-# Build styler
-sty = display_sales[['Tanggal','Produk','Qty','Harga','Total','Stok_Awal','Sisa_Stok','Trend_vs_Juni_pct']].style.format({
-    'Harga': '{:,.0f}',
-    'Total': '{:,.0f}',
-}).applymap(lambda v: '', subset=['Tanggal','Produk','Qty','Harga','Total']) \
-  .applymap(lambda v: color_stock(v), subset=['Sisa_Stok']) \
-  .applymap(lambda v: '', subset=['Trend_vs_Juni_pct'])  # trend coloring below
-
-# For trend coloring we need to apply on numeric column Trend_vs_Juni
-# Create a style for trend column separately
-def style_trend_col(df):
-    return [color_trend(x) for x in df['Trend_vs_Juni'].values]
-
-try:
-    sty = sty.apply(lambda df: style_trend_col(display_sales), axis=0, subset=['Trend_vs_Juni_pct'])
-except Exception:
-    # fallback: no style for trend
-    pass
-
-st.write("Keterangan: baris berwarna merah = stok rendah; hijau = tren naik vs Juni; kuning = sama; merah = turun.")
-st.dataframe(display_sales[['Tanggal','Produk','Qty','Harga','Total','Sisa_Stok','Trend_vs_Juni_pct']].sort_values(['Produk','Tanggal']), height=360)
+# Prepare display table: hanya kolom yang ditampilkan (tanpa deep copy seluruh frame sales)
+# Indikator warna dihitung sekali, dirender native oleh st.dataframe tanpa Styler per sel
+stock_v = sales['Sisa_Stok'].to_numpy(dtype=float)
+trend_v = sales['Trend_vs_Juni'].to_numpy(dtype=float)
+display_sales = sales[['Tanggal','Produk','Qty','Harga','Total','Sisa_Stok','Trend_vs_Juni']].assign(
+    Total=sales['Total'].fillna(0).astype(float),
+    Stok_Flag=np.where(stock_v <= 50, "🔴", ""),
+    Trend_vs_Juni_pct=format_pct(sales['Trend_vs_Juni']),
+    Tren_Flag=np.select([np.isnan(trend_v), trend_v > 0, trend_v < 0], ["", "🟢", "🔴"], default="🟡"),
+)
+
+st.write("Keterangan: 🔴 di kolom Stok = stok rendah (≤ 50); Tren vs Juni: 🟢 naik, 🟡 sama, 🔴 turun.")
+st.dataframe(
+    display_sales[['Tanggal','Produk','Qty','Harga','Total','Sisa_Stok','Stok_Flag','Trend_vs_Juni_pct','Tren_Flag']].sort_values(['Produk','Tanggal']),
+    height=360,
+    column_config={
+        'Harga': st.column_config.NumberColumn(format="%d"),
+        'Total': st.column_config.NumberColumn(format="%d"),
+        'Sisa_Stok': st.column_config.NumberColumn(),
+        'Stok_Flag': st.column_config.TextColumn("Stok", width="small"),
+        'Trend_vs_Juni_pct': st.column_config.TextColumn(),
+        'Tren_Flag': st.column_config.TextColumn("Tren", width="small"),
+    },
+)
 
 # -----------------------
 # Expiry monitoring
 # -----------------------
 st.header("Monitoring Expiry")
-expiry['Exp_Date'] = pd.to_datetime(expiry['Exp_Date'], errors='coerce')
-expiry['Days_to_Expiry'] = (expiry['Exp_Date'] - pd.Timestamp.today()).dt.days
-expiry['Status'] = expiry['Days_to_Expiry'].apply(lambda d: 'Expired' if d < 0 else ('Almost expired' if d <= 30 else 'OK'))
+# selisih hari (dibulatkan ke bawah, seperti Timedelta.days); NaT -> NaN
+exp = expiry['Exp_Date'].to_numpy(dtype='datetime64[ns]')
+d = np.floor((exp - np.datetime64(pd.Timestamp.today(), 'ns')) / np.timedelta64(1, 'D'))
+expiry['Days_to_Expiry'] = pd.array(d, dtype='Int64')
+expiry['Status'] = np.select([d < 0, d <= 30], ['Expired', 'Almost expired'], default='OK')
 
 # show table with highlights
 st.dataframe(expiry[['Produk','Batch_No','Exp_Date','Qty_Stok','Days_to_Expiry','Status']])
@@ -281,7 +376,7 @@ st.dataframe(expiry[['Produk','Batch_No','Exp_Date','Qty_Stok','Days_to_Expiry',
 st.header("Pricing Data")
 if not pricing.empty:
     pricing_display = pricing.copy()
-    pricing_display['Margin_pct'] = pricing_display['Margin_pct'].map(lambda x: f"{x:.2%}" if not pd.isna(x) else "-")
+    pricing_display['Margin_pct'] = format_pct(pricing_display['Margin_pct'])
     st.table(pricing_display)
 else:
     st.write("Tidak ada data pricing.")
@@ -289,7 +384,7 @@ else:
 st.header("Promo Data")
 if not promo.empty:
     promo_display = promo.copy()
-    promo_display['ROI'] = promo_display['ROI'].map(lambda x: f"{x:.2%}" if not pd.isna(x) else "-")
+    promo_display['ROI'] = format_pct(promo_display['ROI'])
     st.table(promo_display)
 else:
     st.write("Tidak ada data promo.")
@@ -300,11 +395,34 @@ else:
 st.header("Export / Unduh")
 @st.cache_data
 def to_csv_bytes(df):
-    return df.to_csv(index=False).encode('utf-8')
+    # writer CSV PyArrow (C++, multi-thread) jauh lebih cepat dari df.to_csv untuk tabel lebar;
+    # output disamakan dengan df.to_csv (tanggal tanpa jam, header & nilai tanpa kutip bila tidak perlu)
+    out = df.copy(deep=False)
+    for i in range(out.shape[1]):
+        col = out.iloc[:, i]
+        if pd.api.types.is_datetime64_any_dtype(col):
+            date_only = (col.isna() | (col == col.dt.normalize())).all()
+            out.isetitem(i, col.dt.strftime('%Y-%m-%d' if date_only else '%Y-%m-%d %H:%M:%S'))
+        elif col.dtype == object:
+            # kolom campuran (teks + angka) tidak bisa langsung dikonversi ke Arrow
+            out.isetitem(i, col.astype('string[pyarrow]'))
+    try:
+        buf = pa.BufferOutputStream()
+        pac.write_csv(pa.Table.from_pandas(out, preserve_index=False), buf,
+                      pac.WriteOptions(include_header=False, quoting_style='none'))
+        header = StringIO()
+        csv.writer(header, lineterminator='\n').writerow(out.columns)
+        return header.getvalue().encode('utf-8') + buf.getvalue().to_pybytes()
+    except (pa.ArrowException, ValueError):
+        # mis. nilai berisi koma/kutip/baris baru, atau nama kolom ganda: pakai writer pandas
+        return df.to_csv(index=False).encode('utf-8')
+
+# export: MonthYear tetap label 'YYYY-MM' seperti sebelumnya; kolom bantu Month tidak ikut
+export_sales = sales.drop(columns='Month').assign(MonthYear=sales['Tanggal'].dt.strftime('%Y-%m'))
 
 colA, colB = st.columns(2)
 with colA:
-    st.download_button("Unduh Sales Data (diproses) CSV", to_csv_bytes(sales), "sales_processed.csv", "text/csv")
+    st.download_button("Unduh Sales Data (diproses) CSV", to_csv_bytes(export_sales), "sales_processed.csv", "text/csv")
 with colB:
     st.download_button("Unduh Expiry Data CSV", to_csv_bytes(expiry), "expiry_processed.csv", "text/csv")
 
@@ -316,93 +434,22 @@ st.sidebar.header("Pengaturan")
 safety_stock = st.sidebar.number_input("Threshold stok rendah (Sisa_Stok)", min_value=0, value=50)
 show_only_low_stock = st.sidebar.checkbox("Tunjukkan hanya stok rendah di tabel", value=False)
 
+@st.cache_data(show_spinner=False)
+def sort_by_stock(df):
+    """Urutkan sekali menurut Sisa_Stok agar filter threshold cukup pakai searchsorted."""
+    return df.sort_values('Sisa_Stok', kind='stable').reset_index(drop=True)
+
 if show_only_low_stock:
-    low = sales[sales['Sisa_Stok'] <= safety_stock]
+    sorted_df = sort_by_stock(display_sales)
+    # cari di view float: NA jadi NaN (terurut di akhir), searchsorted Arrow menolak kolom dengan NA
+    k = np.searchsorted(sorted_df['Sisa_Stok'].to_numpy(dtype=float), safety_stock, side='right')
+    low = sorted_df.iloc[:k]
     st.subheader(f"Produk dengan Sisa_Stok ≤ {safety_stock}")
     st.dataframe(low[['Tanggal','Produk','Qty','Total','Sisa_Stok','Trend_vs_Juni_pct']])
 
 #import streamlit as st
 #import pandas as pd
 
-# Load data dari Excel
-#file_path = "Groseri_Database_100Items.xlsx"
-#xls = pd.ExcelFile(file_path)
-
-#sales = pd.read_excel(xls, "Sales Data")
-#pricing = pd.read_excel(xls, "Pricing Data")
-#promo = pd.read_excel(xls, "Promo Data")
-#expiry = pd.read_excel(xls, "Expiry Data")
-
-# Hitung KPI
-#total_sales = sales["Total"].sum()
-#avg_margin = ((pricing["Harga_Jual"] - pricing["Harga_Beli"]) / pricing["Harga_Jual"]).mean()
-#roi = (promo["Actual_Sales"].sum() - promo["Target_Sales"].sum()) / promo["Biaya_Promosi"].sum()
-#stok_avail = sales["Sisa_Stok"].sum() / sales["Stok_Awal"].sum()
-#expiry_risk = expiry.loc[expiry["Exp_Date"] <= pd.Timestamp.today() + pd.Timedelta(days=30), "Qty_Stok"].sum()
-
-# Tampilkan KPI
-#st.title("📊 Dashboard KPI Groseri")
-
-#st.metric("Sales", f"Rp {total_sales:,.0f}")
-#st.metric("Margin", f"{avg_margin:.1%}")
-#st.metric("ROI Promo", f"{roi:.1%}")
-#st.metric("Stok Availability", f"{stok_avail:.1%}")
-#st.metric("Expiry Risk", f"{expiry_risk} unit")
-
-
-import streamlit as st
-import pandas as pd
-
-# Load data
-file_path = "Groseri_Database_100Items.xlsx"
-xls = pd.ExcelFile(file_path)
-
-sales = pd.read_excel(xls, "Sales Data")
-pricing = pd.read_excel(xls, "Pricing Data")
-promo = pd.read_excel(xls, "Promo Data")
-expiry = pd.read_excel(xls, "Expiry Data")
-
-# Hitung KPI
-total_sales = sales["Total"].sum()
-avg_margin = ((pricing["Harga_Jual"] - pricing["Harga_Beli"]) / pricing["Harga_Jual"]).mean()
-roi = (promo["Actual_Sales"].sum() - promo["Target_Sales"].sum()) / promo["Biaya_Promosi"].sum()
-stok_avail = sales["Sisa_Stok"].sum() / sales["Stok_Awal"].sum()
-expiry_risk = expiry.loc[expiry["Exp_Date"] <= pd.Timestamp.today() + pd.Timedelta(days=30), "Qty_Stok"].sum()
-
-# Fungsi indikator warna
-def rag_indicator(value, green_thr, yellow_thr, reverse=False):
-    if reverse:  # contoh: expiry risk (semakin kecil semakin bagus)
-        if value <= green_thr: return "🟢"
-        elif value <= yellow_thr: return "🟡"
-        else: return "🔴"
-    else:
-        if value >= green_thr: return "🟢"
-        elif value >= yellow_thr: return "🟡"
-        else: return "🔴"
-
-# Dashboard
-st.title("📊 KPI Groseri")
-
-# KPI Cards dengan expander penjelasan
-with st.expander(f"{rag_indicator(total_sales, 1e8, 5e7)} Sales: Rp {total_sales:,.0f}"):
-    st.write("Mengukur total penjualan. Hijau jika ≥ target.")
-
-with st.expander(f"{rag_indicator(avg_margin, 0.25, 0.15)} Margin: {avg_margin:.1%}"):
-    st.write("Profitabilitas. Kuning artinya cukup tapi harus diawasi.")
-
-with st.expander(f"{rag_indicator(roi, 1.0, 0.0)} ROI Promosi: {roi:.1%}"):
-    st.write("Efektivitas promosi. Hijau artinya promosi menguntungkan.")
-
-with st.expander(f"{rag_indicator(stok_avail, 0.7, 0.4)} Stok Availability: {stok_avail:.1%}"):
-    st.write("Ketersediaan stok. Hijau jika aman.")
-
-with st.expander(f"{rag_indicator(expiry_risk, 100, 500, reverse=True)} Expiry Risk: {expiry_risk} unit"):
-    st.write("Produk dekat expired. Merah = risiko tinggi.")
-
-
-#import streamlit as st
-#import pandas as pd
-
 # Load data
 #file_path = "Groseri_Database_100Items.xlsx"
 #xls = pd.ExcelFile(file_path)